@@ -1,6 +1,9 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from io import BytesIO
-from huffman.huffman import HuffmanCoder, build_frequency_table
+from huffman.huffman import default_coder
+import mmap
+import numpy as np
+import tempfile
 import time
 import gzip
 import json
@@ -8,6 +11,54 @@ import json
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 
 MAX_FILE_SIZE = 750 * 1024 * 1024  # 750 MB
+CHUNK_SIZE = 1024 * 1024           # lectura de uploads en bloques de 1 MiB
+SPOOL_MAX = 32 * 1024 * 1024       # por encima de esto el temporal va a disco
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+def _iter_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _spool_upload(stream):
+    """Vuelca el upload a un archivo temporal sin retenerlo entero en RAM.
+
+    Devuelve (tmp, data, size): `data` es bytes para uploads chicos o un
+    mmap de solo lectura si el temporal se volcó a disco. El llamador
+    debe cerrar ambos al terminar.
+    """
+    tmp = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    size = 0
+    for chunk in _iter_chunks(stream):
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            tmp.close()
+            raise FileTooLarge()
+        tmp.write(chunk)
+    if size == 0:
+        tmp.close()
+        return None, b'', 0
+    tmp.seek(0)
+    if size > SPOOL_MAX:
+        # fileno() fuerza el volcado a disco, pero acá ya ocurrió por tamaño
+        data = mmap.mmap(tmp.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        data = tmp.read()
+    return tmp, data, size
+
+
+def _close_upload(tmp, data):
+    if isinstance(data, mmap.mmap):
+        data.close()
+    if tmp is not None:
+        tmp.close()
 
 
 @app.route('/')
@@ -25,18 +76,23 @@ def analyze():
     f = request.files.get('file')
     if not f:
         return jsonify({'error': 'No file provided'}), 400
-    
-    data = f.read()
-    
-    if len(data) == 0:
+
+    # histograma acumulado por bloque: el análisis solo necesita las
+    # frecuencias y el tamaño, nunca el archivo entero en memoria
+    counts = np.zeros(256, dtype=np.int64)
+    size = 0
+    for chunk in _iter_chunks(f.stream):
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            return jsonify({'error': f'File too large (max {MAX_FILE_SIZE // (1024*1024)} MB)'}), 413
+        counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+
+    if size == 0:
         return jsonify({'error': 'File is empty'}), 400
-    
-    if len(data) > MAX_FILE_SIZE:
-        return jsonify({'error': f'File too large (max {MAX_FILE_SIZE // (1024*1024)} MB)'}), 413
-    
+
     try:
-        freqs = build_frequency_table(data)
-        coder = HuffmanCoder()
+        freqs = {int(i): int(c) for i, c in enumerate(counts) if c}
+        coder = default_coder
         tree = coder.build_tree_from_freq(freqs)
         entropy = coder.entropy_from_freq(freqs)
         tree_dict = coder.tree_to_dict(tree)
@@ -53,7 +109,7 @@ def analyze():
             'frequencies': freqs,
             'entropy': entropy,
             'tree': tree_dict,
-            'original_size': len(data),
+            'original_size': size,
             'codes': codes_serializable,
             'avg_code_length': avg_code_length,
             'efficiency': efficiency
@@ -67,51 +123,63 @@ def compress():
     f = request.files.get('file')
     if not f:
         return jsonify({'error': 'No file provided'}), 400
-    
-    data = f.read()
-    
-    if len(data) == 0:
-        return jsonify({'error': 'File is empty'}), 400
-    
-    if len(data) > MAX_FILE_SIZE:
+
+    try:
+        tmp, data, size = _spool_upload(f.stream)
+    except FileTooLarge:
         return jsonify({'error': f'File too large (max {MAX_FILE_SIZE // (1024*1024)} MB)'}), 413
-    
-    coder = HuffmanCoder()
+
+    if size == 0:
+        return jsonify({'error': 'File is empty'}), 400
+
+    coder = default_coder
     start = time.time()
-    
+
     try:
-        compressed_bytes, meta = coder.compress_bytes(data)
+        info, chunks = coder.compress_stream(data)
+        # solo cubre la pasada de análisis; la codificación corre
+        # mientras se transmite la respuesta
         duration = time.time() - start
+
+        # Compute gzip size for comparison only when the client asks for it:
+        # it's a second full pass over the input on the request path.
+        gz_size = None
+        if request.args.get('compare') == 'gzip':
+            gz_buf = BytesIO()
+            with gzip.GzipFile(fileobj=gz_buf, mode='wb') as gz:
+                gz.write(data)
+            gz_size = len(gz_buf.getvalue())
     except Exception as e:
+        _close_upload(tmp, data)
         return jsonify({'error': f'Compression failed: {str(e)}'}), 500
 
-    # Compute gzip size for comparison
-    gz_buf = BytesIO()
-    with gzip.GzipFile(fileobj=gz_buf, mode='wb') as gz:
-        gz.write(data)
-    gz_bytes = gz_buf.getvalue()
-
-    bio = BytesIO(compressed_bytes)
-    bio.seek(0)
-
+    info = dict(info)
+    compressed_size = info.pop('compressed_size')
     stats = {
-        'original_size': len(data),
-        'compressed_size': len(compressed_bytes),
-        'gzip_size': len(gz_bytes),
+        'original_size': size,
+        'compressed_size': compressed_size,
+        'gzip_size': gz_size,
         'duration_s': duration,
-        'meta': meta
+        'meta': info
     }
-    
-    response = send_file(
-        bio,
+
+    def generate():
+        # el upload debe seguir abierto mientras se codifica
+        try:
+            yield from chunks
+        finally:
+            _close_upload(tmp, data)
+
+    return Response(
+        stream_with_context(generate()),
         mimetype='application/octet-stream',
-        as_attachment=True,
-        download_name='compressed.huff',
-        conditional=False
+        headers={
+            'Content-Disposition': 'attachment; filename=compressed.huff',
+            'Content-Length': str(compressed_size),
+            # Use compact JSON without newlines for the header
+            'X-Comp-Stats': json.dumps(stats, separators=(',', ':')),
+        },
     )
-    # Use compact JSON without newlines for the header
-    response.headers['X-Comp-Stats'] = json.dumps(stats, separators=(',', ':'))
-    return response
 
 
 @app.route('/api/decompress', methods=['POST'])
@@ -119,23 +187,25 @@ def decompress():
     f = request.files.get('file')
     if not f:
         return jsonify({'error': 'No file provided'}), 400
-    
-    data = f.read()
-    
-    if len(data) == 0:
-        return jsonify({'error': 'File is empty'}), 400
-    
-    if len(data) > MAX_FILE_SIZE:
+
+    try:
+        tmp, data, size = _spool_upload(f.stream)
+    except FileTooLarge:
         return jsonify({'error': f'File too large (max {MAX_FILE_SIZE // (1024*1024)} MB)'}), 413
-    
-    coder = HuffmanCoder()
+
+    if size == 0:
+        return jsonify({'error': 'File is empty'}), 400
+
+    coder = default_coder
     try:
         decompressed = coder.decompress_bytes(data)
     except ValueError as e:
         return jsonify({'error': f'Invalid file format: {str(e)}'}), 400
     except Exception as e:
         return jsonify({'error': f'Decompression failed: {str(e)}'}), 500
-    
+    finally:
+        _close_upload(tmp, data)
+
     bio = BytesIO(decompressed)
     bio.seek(0)
     
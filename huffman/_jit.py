@@ -0,0 +1,154 @@
+"""Kernels compilados con Numba para los bucles calientes del codec.
+
+Numba es opcional: si no está instalado, los llamadores en
+``huffman.huffman`` usan las implementaciones puras de Python.
+"""
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+if HAVE_NUMBA:
+    import numpy as np
+
+
+if HAVE_NUMBA:
+
+    # nogil: bajo un servidor WSGI con threads, N workers pueden codificar
+    # y decodificar en N núcleos en vez de serializarse en el GIL
+    @njit(cache=True, nogil=True, boundscheck=False)
+    def encode(data, values, lengths, out, acc, nbits):
+        """Empaqueta el código de cada byte de `data` en `out`.
+
+        `values`/`lengths` son tablas de 256 entradas (int64/uint8).
+        Recibe y devuelve el estado del acumulador (acc, nbits) para
+        poder codificar por bloques; el padding final lo agrega el
+        llamador. Devuelve (bytes_escritos, acc, nbits). `out` debe
+        cubrir el peor caso del bloque: len(data) * largo_máximo / 8
+        más unos bytes de margen.
+        """
+        pos = 0
+        for i in range(data.size):
+            b = data[i]
+            n = lengths[b]
+            acc = (acc << n) | values[b]
+            nbits += n
+            while nbits >= 8:
+                nbits -= 8
+                out[pos] = (acc >> nbits) & 0xFF
+                pos += 1
+            acc &= (1 << nbits) - 1
+        return pos, acc, nbits
+
+    @njit(cache=True, nogil=True, boundscheck=False)
+    def decode2(data, start, table, lmax, out):
+        """Decodifica con la tabla de a dos símbolos por entrada.
+
+        Cada entrada empaqueta sym1 | sym2<<8 | largo1<<16 |
+        largo_total<<21 | n_símbolos<<26: cuando la ventana de `lmax`
+        bits cubre dos códigos completos se emiten ambos en una sola
+        consulta, amortizando el despacho por iteración. Devuelve
+        cuántos símbolos produjo.
+        """
+        acc = 0
+        nbits = 0
+        pos = start
+        n = data.size
+        mask = (1 << lmax) - 1
+        count = 0
+        total = out.size
+        while count < total:
+            while nbits < lmax and pos < n:
+                acc = (acc << 8) | data[pos]
+                nbits += 8
+                pos += 1
+            if nbits >= lmax:
+                window = (acc >> (nbits - lmax)) & mask
+            else:
+                window = (acc << (lmax - nbits)) & mask
+            entry = table[window]
+            nsym = entry >> 26
+            if nsym == 0:
+                break
+            len1 = (entry >> 16) & 0x1F
+            lentot = (entry >> 21) & 0x1F
+            if nsym == 2 and count + 1 < total and lentot <= nbits:
+                out[count] = entry & 0xFF
+                out[count + 1] = (entry >> 8) & 0xFF
+                count += 2
+                nbits -= lentot
+            elif len1 <= nbits:
+                out[count] = entry & 0xFF
+                count += 1
+                nbits -= len1
+            else:
+                break
+            acc &= (1 << nbits) - 1
+        return count
+
+    @njit(cache=True, nogil=True, boundscheck=False)
+    def decode(data, start, table, lmax, out):
+        """Decodifica el bitstream con la tabla canónica plana.
+
+        `table` tiene 2^lmax entradas (símbolo << 8) | largo. Escribe a
+        lo sumo `out.size` símbolos y devuelve cuántos produjo.
+        """
+        acc = 0
+        nbits = 0
+        pos = start
+        n = data.size
+        mask = (1 << lmax) - 1
+        count = 0
+        total = out.size
+        while count < total:
+            while nbits < lmax and pos < n:
+                acc = (acc << 8) | data[pos]
+                nbits += 8
+                pos += 1
+            if nbits >= lmax:
+                window = (acc >> (nbits - lmax)) & mask
+            else:
+                window = (acc << (lmax - nbits)) & mask
+            entry = table[window]
+            clen = entry & 0xFF
+            if clen == 0 or clen > nbits:
+                break
+            out[count] = entry >> 8
+            count += 1
+            nbits -= clen
+            acc &= (1 << nbits) - 1
+        return count
+
+    def _warmup():
+        """Toca cada kernel una vez al importar el módulo.
+
+        Con cache=True la compilación queda en disco: después de la
+        primera corrida en una máquina, esto solo carga el objeto
+        cacheado, así ningún request (ni ningún test) paga el JIT.
+        """
+        # alfabeto {0, 1} con códigos canónicos de 1 bit
+        data = np.array([0, 1, 0], dtype=np.uint8)
+        values = np.zeros(256, dtype=np.int64)
+        values[1] = 1
+        lengths = np.zeros(256, dtype=np.uint8)
+        lengths[0] = lengths[1] = 1
+        out = np.empty(8, dtype=np.uint8)
+        n, acc, nbits = encode(data, values, lengths, out, 0, 0)
+        bits = np.array([(acc << (8 - nbits)) & 0xFF], dtype=np.uint8)
+
+        table = np.zeros(2, dtype=np.int32)
+        table[0] = (0 << 8) | 1
+        table[1] = (1 << 8) | 1
+        decoded = np.empty(3, dtype=np.uint8)
+        decode(bits, 0, table, 1, decoded)
+
+        # tabla doble con ventana de 2 bits sobre el mismo alfabeto:
+        # sym1 | sym2<<8 | largo1<<16 | largo_total<<21 | n<<26
+        table2 = np.zeros(4, dtype=np.int32)
+        for w in range(4):
+            table2[w] = (w >> 1) | ((w & 1) << 8) | (1 << 16) | (2 << 21) | (2 << 26)
+        decode2(bits, 0, table2, 2, decoded)
+
+    _warmup()
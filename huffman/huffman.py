@@ -1,10 +1,119 @@
 import heapq
-from collections import Counter
+import os
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from math import log2
-from huffman.utils import BitWriter, BitReader, pack_metadata, unpack_metadata
+
+import numpy as np
+
+from huffman import _jit
+from huffman.utils import (
+    BitReader,
+    FORMAT_CHUNKED,
+    FORMAT_LENGTHS,
+    FORMAT_LENGTHS_DENSE,
+    FORMAT_SINGLE,
+    MAGIC,
+    pack_lengths,
+    pack_varint,
+    unpack_lengths,
+    unpack_metadata,
+    unpack_varint,
+)
+
+
+def _encode_with_tables(data, values, lengths, acc=0, nbits=0):
+    """Pack the code of every input byte into a bytes object.
+
+    Uses two 256-entry tables (code value / code length) and a single
+    integer accumulator, emitting whole bytes as soon as they are
+    available. This avoids one Python-level call per bit. Takes and
+    returns the accumulator state so it can run block by block; final
+    padding is left to the caller. Returns (bytes, acc, nbits).
+    """
+    out = bytearray()
+    for b in data:
+        acc = (acc << lengths[b]) | values[b]
+        nbits += lengths[b]
+        while nbits >= 8:
+            nbits -= 8
+            out.append((acc >> nbits) & 0xFF)
+        acc &= (1 << nbits) - 1
+    return bytes(out), acc, nbits
+
+
+@lru_cache(maxsize=32)
+def _specialized_encoder(codes_key):
+    """Genera (via exec) un codificador con los códigos como constantes.
+
+    Para alfabetos chicos, una cadena if/elif ordenada por frecuencia
+    con los valores inmediatos en el código evita las dos indexaciones
+    de tabla por byte. Se compila una vez por juego de códigos y se
+    cachea, así el costo se amortiza entre requests.
+    """
+    lines = [
+        'def encode(data, acc, nbits):',
+        '    out = bytearray()',
+        '    append = out.append',
+        '    for b in data:',
+    ]
+    branch = 'if'
+    for sym, val, n in codes_key:
+        lines.append('        {} b == {}:'.format(branch, sym))
+        lines.append('            acc = (acc << {}) | {}'.format(n, val))
+        lines.append('            nbits += {}'.format(n))
+        branch = 'elif'
+    lines += [
+        '        while nbits >= 8:',
+        '            nbits -= 8',
+        '            append((acc >> nbits) & 0xFF)',
+        '        acc &= (1 << nbits) - 1',
+        '    return bytes(out), acc, nbits',
+    ]
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return namespace['encode']
+
+
+def _decode_with_table(data, start, table, lmax, expected_size):
+    """Decodifica `expected_size` símbolos usando la tabla canónica.
+
+    En vez de caminar el árbol bit a bit, mira una ventana de `lmax`
+    bits y resuelve símbolo y largo con una sola lectura de tabla.
+    Cada entrada está empaquetada como (símbolo << 8) | largo.
+    """
+    out = bytearray()
+    acc = 0
+    nbits = 0
+    pos = start
+    n = len(data)
+    mask = (1 << lmax) - 1
+    while len(out) < expected_size:
+        while nbits < lmax and pos < n:
+            acc = (acc << 8) | data[pos]
+            nbits += 8
+            pos += 1
+        if nbits >= lmax:
+            window = (acc >> (nbits - lmax)) & mask
+        else:
+            # cola del stream: completar la ventana con ceros de padding
+            window = (acc << (lmax - nbits)) & mask
+        entry = table[window]
+        clen = entry & 0xFF
+        if clen == 0 or clen > nbits:
+            break
+        out.append(entry >> 8)
+        nbits -= clen
+        acc &= (1 << nbits) - 1
+    return bytes(out)
 
 
 class Node:
+    # sin __dict__: ~la mitad de memoria por nodo y acceso a atributos
+    # más directo
+    __slots__ = ('freq', 'symbol', 'left', 'right')
+
     def __init__(self, freq, symbol=None, left=None, right=None):
         self.freq = freq
         self.symbol = symbol
@@ -12,8 +121,8 @@ class Node:
         self.right = right
 
     def is_leaf(self):
-        return self.symbol is not None
-    
+        return self.left is None and self.right is None
+
     def __lt__(self, other):
         return self.freq < other.freq
 
@@ -32,105 +141,525 @@ class HuffmanCoder:
             heapq.heappush(heap, merged)
         return heapq.heappop(heap)
 
-    def tree_to_codes(self, root):
+    def _tree_to_codes_int(self, root):
+        """Devuelve los códigos como {símbolo: (valor, largo_en_bits)}.
+
+        Trabajar con enteros evita construir un str por cada arista del
+        árbol y alimenta directamente el empaquetador de bits.
+        """
         codes = {}
         if root is None:
             return codes
-        def walk(node, prefix=''):
+        # recorrido con pila explícita: sin frames de Python por nodo ni
+        # límite de recursión con árboles degenerados
+        stack = [(root, 0, 0)]
+        while stack:
+            node, val, depth = stack.pop()
             if node.is_leaf():
-                codes[node.symbol] = prefix or '0'
-                return
-            walk(node.left, prefix + '0')
-            walk(node.right, prefix + '1')
-        walk(root)
+                codes[node.symbol] = (val, depth or 1)
+            else:
+                stack.append((node.right, (val << 1) | 1, depth + 1))
+                stack.append((node.left, val << 1, depth + 1))
+        return codes
+
+    # tope de largo de código: garantiza que la tabla plana de
+    # decodificación tenga a lo sumo 2^16 entradas
+    MAX_CODE_LENGTH = 16
+
+    def _limit_lengths(self, lengths, lmax=MAX_CODE_LENGTH):
+        """Limita los largos de código a `lmax` bits (estilo zlib/DEFLATE).
+
+        Los códigos que exceden lmax se recortan y el exceso en la suma
+        de Kraft se compensa alargando códigos más cortos, de modo que
+        el resultado sigue siendo un código prefijo completo. Solo los
+        largos importan: los códigos se reasignan canónicamente.
+        """
+        if not lengths or max(lengths.values()) <= lmax:
+            return lengths
+
+        counts = [0] * (lmax + 1)
+        for n in lengths.values():
+            counts[min(n, lmax)] += 1
+
+        # cada recorte viola Kraft en menos de 1: reparar moviendo un
+        # código corto un nivel hacia abajo por unidad de exceso
+        total = sum(c << (lmax - l) for l, c in enumerate(counts))
+        while total > (1 << lmax):
+            bits = lmax - 1
+            while counts[bits] == 0:
+                bits -= 1
+            counts[bits] -= 1
+            counts[bits + 1] += 2
+            counts[lmax] -= 1
+            total -= 1
+
+        # reasigna largos por orden (largo original, símbolo): determinista,
+        # así compresor y descompresor llegan al mismo resultado
+        syms = sorted(lengths, key=lambda s: (lengths[s], s))
+        limited = {}
+        i = 0
+        for n in range(1, lmax + 1):
+            for _ in range(counts[n]):
+                limited[syms[i]] = n
+                i += 1
+        return limited
+
+    def _canonical_codes(self, lengths):
+        """Asigna códigos canónicos a partir de {símbolo: largo}.
+
+        Usa el esquema de conteo de DEFLATE (RFC 1951): un histograma de
+        largos, el primer código de cada largo por recurrencia y luego
+        numeración secuencial por símbolo. Dos pasadas lineales sin
+        ordenar por largo; el compresor y el descompresor reconstruyen
+        exactamente los mismos códigos a partir de los largos solamente.
+        """
+        if not lengths:
+            return {}
+        lmax = max(lengths.values())
+        bl_count = [0] * (lmax + 1)
+        for n in lengths.values():
+            bl_count[n] += 1
+
+        next_code = [0] * (lmax + 1)
+        code = 0
+        for n in range(1, lmax + 1):
+            code = (code + bl_count[n - 1]) << 1
+            next_code[n] = code
+
+        codes = {}
+        for sym in sorted(lengths):
+            n = lengths[sym]
+            codes[sym] = (next_code[n], n)
+            next_code[n] += 1
         return codes
 
+    def _code_lengths(self, freq_dict):
+        """Largo de código por símbolo para la tabla de frecuencias dada.
+
+        Representa el árbol como arreglos paralelos left/right/symbol en
+        vez de objetos Node: para un alfabeto de n símbolos alcanza con
+        2n-1 posiciones, sin un objeto Python por nodo. Solo se
+        conservan los largos; los códigos salen de _canonical_codes.
+
+        El merge usa dos colas (hojas ordenadas por frecuencia y nodos
+        internos, que nacen en orden no decreciente): O(n) extracciones
+        sin el sift del heap en cada paso.
+        """
+        n = len(freq_dict)
+        if n == 0:
+            return {}
+        if n == 1:
+            return {next(iter(freq_dict)): 1}
+
+        size = 2 * n - 1
+        left = [-1] * size
+        right = [-1] * size
+        symbol = [-1] * size
+
+        leaves = deque()
+        idx = 0
+        for sym, f in sorted(freq_dict.items(), key=lambda kv: (kv[1], kv[0])):
+            symbol[idx] = sym
+            leaves.append((f, idx))
+            idx += 1
+        internal = deque()
+
+        def pop_smallest():
+            if leaves and (not internal or leaves[0][0] <= internal[0][0]):
+                return leaves.popleft()
+            return internal.popleft()
+
+        for _ in range(n - 1):
+            f1, i1 = pop_smallest()
+            f2, i2 = pop_smallest()
+            left[idx] = i1
+            right[idx] = i2
+            internal.append((f1 + f2, idx))
+            idx += 1
+
+        lengths = {}
+        stack = [(idx - 1, 0)]
+        while stack:
+            i, depth = stack.pop()
+            if left[i] < 0:
+                lengths[symbol[i]] = depth
+            else:
+                stack.append((left[i], depth + 1))
+                stack.append((right[i], depth + 1))
+        return self._limit_lengths(lengths)
+
+    def _decode_table(self, codes, lmax):
+        """Tabla plana de 2^lmax entradas (símbolo << 8) | largo.
+
+        Cada código se replica sobre las 2^(lmax - largo) ventanas que
+        comienzan con él.
+        """
+        table = np.zeros(1 << lmax, dtype=np.int32)
+        for sym, (val, n) in codes.items():
+            base = val << (lmax - n)
+            table[base:base + (1 << (lmax - n))] = (sym << 8) | n
+        return table
+
+    # con códigos de hasta 11 bits, muchas ventanas cubren dos códigos
+    # completos; por encima la tabla doble (2^lmax entradas) no paga
+    DOUBLE_LMAX = 11
+
+    def _decode_table2(self, codes, lmax):
+        """Tabla plana que resuelve hasta dos símbolos por consulta.
+
+        Cada entrada empaqueta sym1 | sym2<<8 | largo1<<16 |
+        largo_total<<21 | n_símbolos<<26. El segundo símbolo solo se
+        anota si su código entero cabe en lo que resta de la ventana,
+        así el decodificador lo emite sin mirar el stream de nuevo.
+        """
+        size = 1 << lmax
+        sym1 = np.zeros(size, dtype=np.int64)
+        len1 = np.zeros(size, dtype=np.int64)
+        for sym, (val, n) in codes.items():
+            base = val << (lmax - n)
+            sym1[base:base + (1 << (lmax - n))] = sym
+            len1[base:base + (1 << (lmax - n))] = n
+        # correr el primer código fuera de la ventana y consultar de nuevo
+        # da el segundo símbolo de cada ventana, todo vectorizado
+        w2 = (np.arange(size) << len1) & (size - 1)
+        sym2 = sym1[w2]
+        len2 = len1[w2]
+        two = (len1 > 0) & (len1 + len2 <= lmax)
+        nsym = np.where(len1 > 0, np.where(two, 2, 1), 0)
+        lentot = np.where(two, len1 + len2, len1)
+        table = (sym1 | np.where(two, sym2, 0) << 8
+                 | len1 << 16 | lentot << 21 | nsym << 26)
+        return table.astype(np.int32)
+
+    def tree_to_codes(self, root):
+        """Códigos canónicos en str ('0'/'1'), para la API JSON.
+
+        Se derivan de los largos del árbol igual que en el compresor,
+        así /api/analyze muestra los mismos códigos que llevan los
+        streams comprimidos.
+        """
+        lengths = {sym: n for sym, (_, n) in self._tree_to_codes_int(root).items()}
+        codes = self._canonical_codes(self._limit_lengths(lengths))
+        return {
+            sym: format(val, '0{}b'.format(n))
+            for sym, (val, n) in codes.items()
+        }
+
     def tree_to_dict(self, node):
         if node is None:
             return None
-        return {
-            'freq': node.freq,
-            'symbol': node.symbol,
-            'left': self.tree_to_dict(node.left),
-            'right': self.tree_to_dict(node.right)
-        }
+        result = {'freq': node.freq, 'symbol': node.symbol,
+                  'left': None, 'right': None}
+        stack = [(node, result)]
+        while stack:
+            n, d = stack.pop()
+            for key, child in (('left', n.left), ('right', n.right)):
+                if child is not None:
+                    child_dict = {'freq': child.freq, 'symbol': child.symbol,
+                                  'left': None, 'right': None}
+                    d[key] = child_dict
+                    stack.append((child, child_dict))
+        return result
 
     def entropy_from_freq(self, freq_dict):
-        total = sum(freq_dict.values())
+        if not freq_dict:
+            return 0.0
+        if len(freq_dict) <= 16:
+            # con pocos símbolos el bucle directo le gana al armado de arrays
+            total = sum(freq_dict.values())
+            if total == 0:
+                return 0.0
+            H = 0.0
+            for f in freq_dict.values():
+                if f:
+                    p = f / total
+                    H -= p * log2(p)
+            return H
+        f = np.fromiter(freq_dict.values(), dtype=np.float64)
+        total = f.sum()
         if total == 0:
             return 0.0
-        H = 0.0
-        for f in freq_dict.values():
-            p = f / total
-            H -= p * log2(p)
-        return H
+        p = f / total
+        # where= evita log2(0); esos términos aportan 0 a la suma
+        return float(-(p * np.log2(p, where=p > 0, out=np.zeros_like(p))).sum())
 
     def average_code_length(self, freq_dict, codes):
         total = sum(freq_dict.values())
         if total == 0:
             return 0.0
-        
-        weighted_sum = 0.0
+
+        freq_arr = np.zeros(256, dtype=np.float64)
+        lens_arr = np.zeros(256, dtype=np.float64)
         for symbol, freq in freq_dict.items():
-            if symbol in codes:
-                code_length = len(codes[symbol])
-                weighted_sum += freq * code_length
-        
-        return weighted_sum / total
+            freq_arr[symbol] = freq
+        for symbol, code in codes.items():
+            # acepta tanto (valor, largo) como la forma en str
+            lens_arr[symbol] = code[1] if isinstance(code, tuple) else len(code)
+
+        return float(np.dot(freq_arr, lens_arr) / total)
 
     def compress_bytes(self, data: bytes):
         if not data:
             raise ValueError("Cannot compress empty data")
-            
-        freqs = Counter(data)
-        
+
+        freqs = build_frequency_table(data)
+        compressed = b''.join(self._compress_blocks(data, freqs, len(data)))
         if len(freqs) == 1:
-            symbol = list(freqs.keys())[0]
-            count = freqs[symbol]
-            bw = BitWriter()
-            meta = pack_metadata(freqs)
-            bw.write_bytes(meta)
-            bw.flush()
-            return bw.get_bytes(), {'freq_count': 1, 'single_symbol': True}
-        
-        root = self.build_tree_from_freq(freqs)
-        codes = self.tree_to_codes(root)
-        bw = BitWriter()
-        
-        # write metadata
-        meta = pack_metadata(freqs)
-        bw.write_bytes(meta)
-        
-        # write bits
-        for b in data:
-            code = codes[b]
-            for ch in code:
-                bw.write_bit(1 if ch == '1' else 0)
-        bw.flush()
-        return bw.get_bytes(), {'freq_count': len(freqs)}
+            return compressed, {'freq_count': 1, 'single_symbol': True}
+        return compressed, {'freq_count': len(freqs)}
+
+    def compress_stream(self, data, block_size=1024 * 1024):
+        """Comprime por bloques, pensado para respuestas HTTP en streaming.
+
+        Devuelve (info, generador). El generador produce el mismo stream
+        que compress_bytes sin materializarlo entero; `info` incluye el
+        tamaño comprimido exacto, calculable por adelantado desde los
+        largos de código, lo que permite enviar los headers antes de
+        codificar.
+        """
+        if not data:
+            raise ValueError("Cannot compress empty data")
+
+        freqs = build_frequency_table(data)
+        if len(freqs) == 1:
+            # formato de un solo símbolo: byte de formato, símbolo y conteo
+            size = len(MAGIC) + 2 + len(pack_varint(len(data)))
+            info = {'freq_count': 1, 'single_symbol': True, 'compressed_size': size}
+        elif len(data) > self.CHUNK_SYMBOLS:
+            lengths = _lengths_for(tuple(sorted(freqs.items())))
+            size = (len(MAGIC) + 1 + len(pack_varint(self.CHUNK_SYMBOLS))
+                    + len(pack_lengths(lengths, len(data))))
+            # cada trozo se rellena a byte por separado: el tamaño exacto
+            # sale de un histograma por trozo, no del global
+            lens = np.zeros(256, dtype=np.int64)
+            for s, n in lengths.items():
+                lens[s] = n
+            arr = np.frombuffer(data, dtype=np.uint8)
+            n_chunks = 0
+            for start in range(0, len(arr), self.CHUNK_SYMBOLS):
+                counts = np.bincount(arr[start:start + self.CHUNK_SYMBOLS],
+                                     minlength=256)
+                nbytes = (int(counts @ lens) + 7) // 8
+                size += len(pack_varint(nbytes)) + nbytes
+                n_chunks += 1
+            info = {
+                'freq_count': len(freqs),
+                'chunks': n_chunks,
+                'compressed_size': size,
+            }
+        else:
+            lengths = _lengths_for(tuple(sorted(freqs.items())))
+            total_bits = sum(freqs[s] * n for s, n in lengths.items())
+            meta_size = len(MAGIC) + len(pack_lengths(lengths, len(data)))
+            info = {
+                'freq_count': len(freqs),
+                'compressed_size': meta_size + (total_bits + 7) // 8,
+            }
+        return info, self._compress_blocks(data, freqs, block_size)
+
+    def _block_encoder(self, freqs):
+        """Prepara el codificador de bloques para `freqs`.
+
+        Devuelve (encode, use_jit) donde encode(block, acc, nbits) ->
+        (bytes, acc, nbits) sin padding final. Si use_jit es True,
+        `block` debe ser una vista numpy uint8; si no, bytes.
+        """
+        lengths_by_sym = _lengths_for(tuple(sorted(freqs.items())))
+        codes = self._canonical_codes(lengths_by_sym)
+        values = [0] * 256
+        lengths = [0] * 256
+        for sym, (val, n) in codes.items():
+            values[sym] = val
+            lengths[sym] = n
+
+        # El kernel JIT acumula en un entero de 64 bits: solo sirve si el
+        # código más largo deja lugar en el acumulador (7 bits residuales + 56).
+        max_len = max(lengths)
+        if _jit.HAVE_NUMBA and max_len <= 56:
+            values_arr = np.array(values, dtype=np.int64)
+            lengths_arr = np.array(lengths, dtype=np.uint8)
+
+            def encode(block, acc, nbits):
+                # cota por bloque: el promedio <= 8 bits/byte solo vale
+                # sobre el archivo completo, no sobre un bloque aislado
+                out = np.empty(block.size * max_len // 8 + 16, dtype=np.uint8)
+                n, acc, nbits = _jit.encode(
+                    block, values_arr, lengths_arr, out, acc, nbits,
+                )
+                return out[:n].tobytes(), acc, nbits
+
+            return encode, True
+
+        if len(codes) <= 16:
+            # alfabeto chico: codificador especializado, ramas ordenadas
+            # por frecuencia descendente
+            key = tuple(sorted(
+                ((sym, val, n) for sym, (val, n) in codes.items()),
+                key=lambda t: -freqs[t[0]],
+            ))
+            return _specialized_encoder(key), False
+
+        def encode(block, acc, nbits):
+            return _encode_with_tables(block, values, lengths, acc, nbits)
+
+        return encode, False
+
+    # tamaño de trozo del formato paralelo: por debajo de un trozo el
+    # stream va entero en un solo bitstream, sin overhead de planificación
+    CHUNK_SYMBOLS = 4 * 1024 * 1024
+
+    def _compress_blocks(self, data, freqs, block_size):
+        """Genera metadata y luego el bitstream codificado por bloques."""
+        if len(freqs) == 1:
+            # un solo símbolo no admite código canónico (largo 0): se emite
+            # el símbolo y su conteo, O(1) bytes sin bitstream
+            sym, count = next(iter(freqs.items()))
+            yield MAGIC + bytes((FORMAT_SINGLE, sym)) + pack_varint(count)
+            return
+
+        if len(data) > self.CHUNK_SYMBOLS:
+            yield from self._compress_chunked(data, freqs)
+            return
+
+        # códigos canónicos: el descompresor los reconstruye desde los largos
+        lengths_by_sym = _lengths_for(tuple(sorted(freqs.items())))
+        yield MAGIC + pack_lengths(lengths_by_sym, len(data))
+        encode, use_jit = self._block_encoder(freqs)
+        if use_jit:
+            # una sola vista sin copia sobre el buffer completo (bytes o
+            # mmap); los bloques son slices de la vista, así no se
+            # materializa un bytes intermedio por bloque
+            arr = np.frombuffer(data, dtype=np.uint8)
+
+        acc = 0
+        nbits = 0
+        for start in range(0, len(data), block_size):
+            block = (arr[start:start + block_size] if use_jit
+                     else data[start:start + block_size])
+            chunk, acc, nbits = encode(block, acc, nbits)
+            if chunk:
+                yield chunk
+        if nbits:
+            yield bytes([(acc << (8 - nbits)) & 0xFF])
+
+    def _compress_chunked(self, data, freqs):
+        """Formato por trozos: bitstreams independientes, una sola tabla.
+
+        Cada trozo de CHUNK_SYMBOLS símbolos se codifica con acumulador
+        propio y padding a byte, precedido por su largo en bytes como
+        varint, así el descompresor puede repartir los trozos entre
+        threads.
+        """
+        chunk_syms = self.CHUNK_SYMBOLS
+        lengths_by_sym = _lengths_for(tuple(sorted(freqs.items())))
+        yield (MAGIC + bytes((FORMAT_CHUNKED,)) + pack_varint(chunk_syms)
+               + pack_lengths(lengths_by_sym, len(data)))
+        encode, use_jit = self._block_encoder(freqs)
+        if use_jit:
+            arr = np.frombuffer(data, dtype=np.uint8)
+        for start in range(0, len(data), chunk_syms):
+            block = (arr[start:start + chunk_syms] if use_jit
+                     else data[start:start + chunk_syms])
+            chunk, acc, nbits = encode(block, 0, 0)
+            if nbits:
+                chunk += bytes([(acc << (8 - nbits)) & 0xFF])
+            yield pack_varint(len(chunk))
+            yield chunk
+
+    # cota de seguridad para salidas reconstruidas desde un conteo en la
+    # metadata: bien por encima de cualquier upload real, pero finita
+    MAX_OUTPUT = 8 * 1024 * 1024 * 1024
 
     def decompress_bytes(self, data: bytes):
 
         if not data:
             raise ValueError("Cannot decompress empty data")
-            
+
+        # los bytes de formato solo se interpretan detrás del prefijo
+        # mágico: así el rechazo de archivos ajenos es O(1) y un blob
+        # arbitrario no puede caer en un branch de formato. Los streams
+        # legados sin prefijo empiezan con 0x00/0x01 (byte alto del
+        # conteo '>H') y van por el camino de frecuencias de abajo.
+        if bytes(data[:len(MAGIC)]) == MAGIC:
+            base = len(MAGIC)
+            fmt = data[base] if base < len(data) else None
+
+            if fmt == FORMAT_SINGLE:
+                if len(data) < base + 3:
+                    raise ValueError("Invalid compressed data: truncated stream")
+                symbol = data[base + 1]
+                count, end = unpack_varint(data, base + 2)
+                # el varint del conteo cierra el stream; un conteo absurdo
+                # en un stream crafteado no debe llegar a asignar la salida
+                if end != len(data) or count > self.MAX_OUTPUT:
+                    raise ValueError("Invalid compressed data: bad symbol count")
+                # repetición a nivel C: evita materializar una lista de count ints
+                return bytes((symbol,)) * count
+
+            if fmt in (FORMAT_LENGTHS, FORMAT_LENGTHS_DENSE):
+                lengths, total, pos = unpack_lengths(data, base)
+                # el total viene de un varint del stream: acotarlo antes
+                # de que llegue a asignar el buffer de salida
+                if total > self.MAX_OUTPUT:
+                    raise ValueError("Invalid compressed data: bad symbol count")
+                lmax = self._validate_lengths(lengths)
+                return self._decode_payload(data, pos, lengths, lmax, total)
+
+            if fmt == FORMAT_CHUNKED:
+                chunk_syms, pos = unpack_varint(data, base + 1)
+                if chunk_syms == 0 or chunk_syms > self.MAX_OUTPUT:
+                    raise ValueError("Invalid compressed data: bad chunk size")
+                lengths, total, pos = unpack_lengths(data, pos)
+                if total > self.MAX_OUTPUT:
+                    raise ValueError("Invalid compressed data: bad symbol count")
+                lmax = self._validate_lengths(lengths)
+                # (offset, símbolos) de cada trozo; los largos en bytes
+                # están delante de cada uno como varint
+                chunks = []
+                remaining = total
+                while remaining > 0:
+                    clen, pos = unpack_varint(data, pos)
+                    if pos + clen > len(data):
+                        raise ValueError("Invalid compressed data: truncated stream")
+                    chunks.append((pos, min(chunk_syms, remaining)))
+                    pos += clen
+                    remaining -= chunks[-1][1]
+
+                if _jit.HAVE_NUMBA and len(chunks) > 1:
+                    # el kernel es nogil: los trozos decodifican en paralelo real
+                    workers = min(len(chunks), os.cpu_count() or 1)
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        parts = list(pool.map(
+                            lambda c: self._decode_payload(data, c[0], lengths, lmax, c[1]),
+                            chunks,
+                        ))
+                else:
+                    parts = [self._decode_payload(data, off, lengths, lmax, n)
+                             for off, n in chunks]
+                return b''.join(parts)
+
+            raise ValueError("Invalid compressed data: unknown format byte")
+
+        # formato de frecuencias: archivos escritos antes del prefijo mágico
         br = BitReader(data)
-        freqs, _ = unpack_metadata(br)
-        
+        freqs, pos = unpack_metadata(br)
+
         if not freqs:
             raise ValueError("Invalid compressed data: no frequency table found")
-        
+
         if len(freqs) == 1:
             symbol, count = list(freqs.items())[0]
-            return bytes([symbol] * count)
-        
+            if count > self.MAX_OUTPUT:
+                raise ValueError("Invalid compressed data: bad symbol count")
+            return bytes((symbol,)) * count
+
+        # los streams legados llevan los códigos del recorrido del árbol
+        # (izquierda=0, derecha=1) tal como los asignaba el compresor
+        # original, no los canónicos: hay que reconstruir el mismo árbol
+        # (la tabla de frecuencias conserva el orden de inserción del
+        # stream) y caminarlo bit a bit
         root = self.build_tree_from_freq(freqs)
-        if root is None:
-            return b''
-            
-        # Calcula la salida
         expected_size = sum(freqs.values())
-        
         out = bytearray()
         node = root
         while len(out) < expected_size:
@@ -143,5 +672,79 @@ class HuffmanCoder:
                 node = root
         return bytes(out)
 
+    def _validate_lengths(self, lengths):
+        """Valida una tabla de largos recibida; devuelve el largo máximo."""
+        if not lengths:
+            raise ValueError("Invalid compressed data: bad code lengths")
+        lmax = max(lengths.values())
+        if lmax > self.MAX_CODE_LENGTH or min(lengths.values()) == 0:
+            raise ValueError("Invalid compressed data: bad code lengths")
+        # una tabla de largos corrupta puede desbordar la tabla plana
+        if sum(1 << (lmax - n) for n in lengths.values()) > (1 << lmax):
+            raise ValueError("Invalid compressed data: bad code lengths")
+        return lmax
+
+    def _decode_payload(self, data, pos, lengths, lmax, total):
+        """Decodifica `total` símbolos del bitstream que empieza en `pos`."""
+        lengths_key = tuple(sorted(lengths.items()))
+        if _jit.HAVE_NUMBA:
+            out = np.empty(total, dtype=np.uint8)
+            arr = np.frombuffer(data, dtype=np.uint8)
+            if lmax <= self.DOUBLE_LMAX:
+                table2 = _decode_table2_for(lengths_key, lmax)
+                n = _jit.decode2(arr, pos, table2, lmax, out)
+            else:
+                table = _decode_table_for(lengths_key, lmax)
+                n = _jit.decode(arr, pos, table, lmax, out)
+            return out[:n].tobytes()
+        table = _decode_table_for(lengths_key, lmax)
+        # indexar listas es más barato que escalares numpy en el bucle Python
+        return _decode_with_table(data, pos, table.tolist(), lmax, total)
+
+# La clase no guarda estado entre llamadas: una sola instancia
+# compartida evita construir un coder por request.
+default_coder = HuffmanCoder()
+
+
+@lru_cache(maxsize=32)
+def _lengths_for(freqs_key):
+    """Largos canónicos cacheados por tabla de frecuencias.
+
+    `freqs_key` es tuple(sorted(freqs.items())). Amortiza el armado del
+    árbol entre requests que comprimen datos con la misma distribución
+    (compress_stream y _compress_blocks lo consultan por separado).
+    """
+    return default_coder._code_lengths(dict(freqs_key))
+
+
+@lru_cache(maxsize=8)
+def _decode_table_for(lengths_key, lmax):
+    """Tabla de decodificación cacheada por tabla de largos.
+
+    La tabla plana puede tener hasta 2^16 entradas; cachearla por
+    `lengths_key` (tuple(sorted(lengths.items()))) amortiza su armado
+    cuando se descomprimen varios streams con el mismo juego de códigos.
+    """
+    codes = default_coder._canonical_codes(dict(lengths_key))
+    return default_coder._decode_table(codes, lmax)
+
+
+@lru_cache(maxsize=8)
+def _decode_table2_for(lengths_key, lmax):
+    """Tabla doble cacheada por tabla de largos (solo lmax <= DOUBLE_LMAX)."""
+    codes = default_coder._canonical_codes(dict(lengths_key))
+    return default_coder._decode_table2(codes, lmax)
+
+
 def build_frequency_table(data: bytes):
-    return dict(Counter(data))
+    """Histograma de bytes como dict {símbolo: frecuencia}.
+
+    np.bincount recorre los datos en un solo bucle en C, en vez de un
+    bucle de Python por byte. Para entradas chicas el armado de los
+    arrays numpy cuesta más que contar directo, así que ahí se usa
+    Counter.
+    """
+    if len(data) < 4096:
+        return dict(Counter(data))
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return {int(i): int(c) for i, c in enumerate(counts) if c}
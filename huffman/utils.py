@@ -1,85 +1,224 @@
-from io import BytesIO
 import struct
 
 
 class BitWriter:
-    def __init__(self):
-        self.buffer = BytesIO()
+    def __init__(self, expected_size=0):
+        # preasignar evita los realloc + copia amortizados del bytearray
+        # cuando el tamaño de salida se conoce de antemano
+        self.buffer = bytearray(expected_size)
+        self.pos = 0
         self.acc = 0
         self.nbits = 0
 
+    def _reserve(self, n):
+        need = self.pos + n - len(self.buffer)
+        if need > 0:
+            # crecimiento geométrico si la estimación quedó corta
+            self.buffer.extend(b'\x00' * max(need, len(self.buffer), 64))
+
     def write_bit(self, b):
-        self.acc = (self.acc << 1) | (b & 1)
-        self.nbits += 1
-        if self.nbits == 8:
-            self.buffer.write(bytes([self.acc]))
-            self.acc = 0
-            self.nbits = 0
+        self.write_bits(b & 1, 1)
+
+    def write_bits(self, v, n):
+        """Escribe los `n` bits menos significativos de `v` de una vez.
+
+        Permite emitir un código completo por llamada en lugar de pagar
+        una llamada de Python por bit. Los bits altos sobrantes de `v`
+        se descartan: sin la máscara contaminarían los bytes que ya
+        están en el acumulador.
+        """
+        self.acc = (self.acc << n) | (v & ((1 << n) - 1))
+        self.nbits += n
+        if self.nbits >= 8:
+            # volcar todos los bytes completos de una vez (un to_bytes y
+            # una asignación de slice) en lugar de un append por byte
+            nbytes = self.nbits >> 3
+            self.nbits &= 7
+            chunk = (self.acc >> self.nbits).to_bytes(nbytes, 'big')
+            self._reserve(nbytes)
+            self.buffer[self.pos:self.pos + nbytes] = chunk
+            self.pos += nbytes
+            self.acc &= (1 << self.nbits) - 1
 
     def write_bytes(self, bts: bytes):
-        self.buffer.write(bts)
+        self._reserve(len(bts))
+        self.buffer[self.pos:self.pos + len(bts)] = bts
+        self.pos += len(bts)
 
     def flush(self):
         if self.nbits > 0:
-            self.acc = self.acc << (8 - self.nbits)
-            self.buffer.write(bytes([self.acc]))
+            self._reserve(1)
+            self.buffer[self.pos] = (self.acc << (8 - self.nbits)) & 0xFF
+            self.pos += 1
             self.acc = 0
             self.nbits = 0
 
     def get_bytes(self):
-        return self.buffer.getvalue()
+        return bytes(self.buffer[:self.pos])
 
 
 class BitReader:
     def __init__(self, data: bytes):
-        self.buffer = BytesIO(data)
-        self.cur = 0
+        # vista sin copia: funciona igual sobre bytes, bytearray o mmap
+        self.data = memoryview(data)
+        self.pos = 0
+        self.acc = 0
         self.nbits = 0
 
-    def read_bit(self):
-        if self.nbits == 0:
-            byte = self.buffer.read(1)
-            if not byte:
+    def _refill(self):
+        # cargar bytes enteros hasta llenar el acumulador de 64 bits:
+        # amortiza el chequeo de límites sobre 8 bytes por recarga
+        while self.nbits <= 56 and self.pos < len(self.data):
+            self.acc = (self.acc << 8) | self.data[self.pos]
+            self.nbits += 8
+            self.pos += 1
+
+    def peek_bits(self, n):
+        """Mira los próximos `n` bits (MSB primero) sin consumirlos.
+
+        Devuelve None si no quedan `n` bits en el stream.
+        """
+        if self.nbits < n:
+            self._refill()
+            if self.nbits < n:
                 return None
-            self.cur = byte[0]
-            self.nbits = 8
-        self.nbits -= 1
-        return (self.cur >> self.nbits) & 1
+        return (self.acc >> (self.nbits - n)) & ((1 << n) - 1)
+
+    def consume(self, n):
+        self.nbits -= n
+        self.acc &= (1 << self.nbits) - 1
+
+    def read_bit(self):
+        b = self.peek_bits(1)
+        if b is not None:
+            self.consume(1)
+        return b
 
     def read_bytes(self, n):
-        return self.buffer.read(n)
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return bytes(chunk)
 
 
-def pack_metadata(freqs: dict):
-    n = len(freqs)
+# prefijo mágico de los streams nuevos: permite rechazar archivos que
+# no son .huff en O(1), antes de parsear metadata
+MAGIC = b'HUF1'
+
+# primer byte de un stream con tabla de largos canónicos; el formato
+# legado de frecuencias empieza con el byte alto de un conteo '>H'
+# (0x00 o 0x01), así que no hay ambigüedad
+FORMAT_LENGTHS = 0x02
+# variante densa: vector fijo de 256 largos (1 byte por símbolo)
+FORMAT_LENGTHS_DENSE = 0x03
+# stream de un solo símbolo: byte de formato, símbolo y conteo varint;
+# no hay bitstream porque el código canónico de largo 0 no existe
+FORMAT_SINGLE = 0x04
+# stream por trozos: varios bitstreams independientes que comparten una
+# tabla de largos, decodificables en paralelo
+FORMAT_CHUNKED = 0x05
+
+
+def pack_varint(n):
+    """Entero sin signo en base-128 (7 bits por byte, LSB primero)."""
     out = bytearray()
-    out.extend(struct.pack('>H', n))
-    for sym, f in freqs.items():
-        out.append(sym)
-        out.extend(struct.pack('>Q', f))
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def unpack_varint(data, pos):
+    """Lee un varint en `data` desde `pos`; devuelve (valor, pos)."""
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data) or shift > 63:
+            raise ValueError("Invalid metadata: truncated varint")
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not (b & 0x80):
+            return result, pos
+        shift += 7
+
+
+def pack_lengths(lengths: dict, total: int):
+    """Serializa la tabla de largos canónicos.
+
+    Un byte de versión y el total de símbolos originales como varint,
+    seguidos de la tabla en la forma más corta: pares (símbolo, largo)
+    de 2 bytes cuando el alfabeto es disperso, o un vector denso fijo de
+    256 largos (0 = símbolo ausente) cuando hay 128 o más símbolos.
+    """
+    n = len(lengths)
+    if n < 128:
+        out = bytearray([FORMAT_LENGTHS])
+        out += pack_varint(total)
+        out.append(n)
+        for sym, length in sorted(lengths.items()):
+            out.append(sym)
+            out.append(length)
+        return bytes(out)
+
+    out = bytearray([FORMAT_LENGTHS_DENSE])
+    out += pack_varint(total)
+    vec = bytearray(256)
+    for sym, length in lengths.items():
+        vec[sym] = length
+    out += vec
     return bytes(out)
 
 
+def unpack_lengths(data, pos=0):
+    """Lee la tabla de largos desde `pos`; devuelve (lengths, total, pos)."""
+    if pos >= len(data) or data[pos] not in (FORMAT_LENGTHS, FORMAT_LENGTHS_DENSE):
+        raise ValueError("Invalid metadata: bad format byte")
+    fmt = data[pos]
+    total, pos = unpack_varint(data, pos + 1)
+
+    if fmt == FORMAT_LENGTHS_DENSE:
+        if pos + 256 > len(data):
+            raise ValueError("Invalid metadata: incomplete length table")
+        lengths = {sym: data[pos + sym] for sym in range(256) if data[pos + sym]}
+        return lengths, total, pos + 256
+
+    if pos >= len(data):
+        raise ValueError("Invalid metadata: missing symbol count")
+    n = data[pos]
+    pos += 1
+    if pos + 2 * n > len(data):
+        raise ValueError("Invalid metadata: incomplete length table")
+    lengths = {}
+    for _ in range(n):
+        lengths[data[pos]] = data[pos + 1]
+        pos += 2
+    return lengths, total, pos
+
+
+def pack_metadata(freqs: dict):
+    # un solo struct.pack procesa todo el bloque en C (big-endian, sin padding)
+    n = len(freqs)
+    fmt = '>H' + 'BQ' * n
+    args = (n,) + tuple(x for pair in freqs.items() for x in pair)
+    return struct.pack(fmt, *args)
+
+
 def unpack_metadata(bitreader: BitReader):
-    buf = bitreader.buffer
-    buf.seek(0)
-    head = buf.read(2)
-    if not head or len(head) < 2:
+    data = bitreader.data
+    if len(data) < 2:
         raise ValueError("Invalid metadata: header too short")
-    n = struct.unpack('>H', head)[0]
-    freqs = {}
-    for _ in range(n):
-        sym_b = buf.read(1)
-        if not sym_b:
-            raise ValueError("Invalid metadata: incomplete symbol data")
-        sym = sym_b[0]
-        f_raw = buf.read(8)
-        if len(f_raw) < 8:
-            raise ValueError("Invalid metadata: incomplete frequency data")
-        f = struct.unpack('>Q', f_raw)[0]
-        freqs[sym] = f
-    pos = buf.tell()
-    bitreader.buffer.seek(pos)
+    n = struct.unpack_from('>H', data, 0)[0]
+    pos = 2 + 9 * n
+    if len(data) < pos:
+        raise ValueError("Invalid metadata: incomplete frequency data")
+    fields = struct.unpack_from('>' + 'BQ' * n, data, 2)
+    freqs = dict(zip(fields[0::2], fields[1::2]))
+    bitreader.pos = pos
+    bitreader.acc = 0
     bitreader.nbits = 0
     return freqs, pos
 
@@ -222,7 +222,8 @@ compressBtn.addEventListener('click', async () => {
   statsPre.innerText = '⚡ Comprimiendo...';
   
   try {
-    const r = await fetch('/api/compress', { method: 'POST', body: fd });
+    // la comparación con gzip es opcional en el backend: pedirla explícitamente
+    const r = await fetch('/api/compress?compare=gzip', { method: 'POST', body: fd });
     
     stopProgress();
     
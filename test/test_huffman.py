@@ -229,6 +229,30 @@ class TestEdgeCases:
         
         assert decompressed == original
     
+    def test_skewed_frequencies_roundtrip(self):
+        """Test con frecuencias tipo Fibonacci que fuerzan códigos largos."""
+        coder = HuffmanCoder()
+        fibs = [1, 1]
+        while len(fibs) < 30:
+            fibs.append(fibs[-1] + fibs[-2])
+        original = b''.join(bytes([i]) * f for i, f in enumerate(fibs))
+
+        compressed, meta = coder.compress_bytes(original)
+        decompressed = coder.decompress_bytes(compressed)
+
+        assert decompressed == original
+
+    def test_chunked_roundtrip(self):
+        """Test del formato por trozos con umbral de trozo chico."""
+        coder = HuffmanCoder()
+        coder.CHUNK_SYMBOLS = 1024
+        original = b'ABCD' * 2000 + b'xyz' * 1000
+
+        compressed, meta = coder.compress_bytes(original)
+        decompressed = coder.decompress_bytes(compressed)
+
+        assert decompressed == original
+
     def test_compression_ratio(self):
         """Test que la compresión reduce el tamaño para datos repetitivos."""
         coder = HuffmanCoder()